@@ -19,6 +19,7 @@ from pySim.ts_31_103 import CardApplicationISIM
 from pySim.euicc import CardApplicationISDR, CardApplicationECASD
 from pySim.transport import LinkBase
 
+from pySim.apdu_source import ReadAheadApduSource
 from pySim.apdu_source.gsmtap import GsmtapApduSource
 from pySim.apdu_source.pyshark_rspro import PysharkRsproPcap, PysharkRsproLive
 from pySim.apdu_source.pyshark_gsmtap import PysharkGsmtapPcap
@@ -26,8 +27,13 @@ from pySim.apdu_source.tca_loader_log import TcaLoaderLogApduSource
 
 from pySim.apdu.ts_102_221 import UiccSelect, UiccStatus
 
-log_format='%(log_color)s%(levelname)-8s%(reset)s %(name)s: %(message)s'
-colorlog.basicConfig(level=logging.INFO, format = log_format)
+# only use colored log output if stderr is a terminal; skip the ANSI escape sequences otherwise
+if sys.stderr.isatty():
+    log_format='%(log_color)s%(levelname)-8s%(reset)s %(name)s: %(message)s'
+    colorlog.basicConfig(level=logging.INFO, format = log_format)
+else:
+    log_format='%(levelname)-8s %(name)s: %(message)s'
+    logging.basicConfig(level=logging.INFO, format = log_format)
 logger = colorlog.getLogger()
 
 # merge all of the command sets into one global set. This will override instructions,
@@ -38,6 +44,9 @@ from pySim.apdu.global_platform import ApduCommands as GpApduCommands
 ApduCommands = UiccApduCommands + UsimApduCommands #+ GpApduCommands
 
 
+SEPARATOR = "==============================="
+
+
 class DummySimLink(LinkBase):
     """A dummy implementation of the LinkBase abstract base class.  Currently required
     as the UiccCardBase doesn't work without SimCardCommands, which in turn require
@@ -47,10 +56,11 @@ class DummySimLink(LinkBase):
     and claim it is successful.
 
     The UiccCardBase / SimCardCommands should be refactored to make this obsolete later."""
+    _atr = h2i('3B9F96801F878031E073FE211B674A4C753034054BA9')
+
     def __init__(self, debug: bool = False, **kwargs):
         super().__init__(**kwargs)
         self._debug = debug
-        self._atr = h2i('3B9F96801F878031E073FE211B674A4C753034054BA9')
 
     def __str__(self):
         return "dummy"
@@ -76,6 +86,9 @@ class DummySimLink(LinkBase):
 
 
 class Tracer:
+    __slots__ = ('rs', 'ad', 'suppress_status', 'suppress_select', 'show_raw_apdu', 'source',
+                 'suppressed_types')
+
     def __init__(self, **kwargs):
         # we assume a generic UICC profile; as all APDUs return 9000 in DummySimLink above,
         # all CardProfileAddon (including SIM) will probe successful.
@@ -94,50 +107,60 @@ class Tracer:
         self.suppress_select = kwargs.get('suppress_select', True)
         self.show_raw_apdu = kwargs.get('show_raw_apdu', False)
         self.source = kwargs.get('source', None)
+        # ApduCommand classes whose output is suppressed; built once instead of checking each flag per APDU
+        self.suppressed_types = tuple(t for t, suppress in [(UiccSelect, self.suppress_select),
+                                                            (UiccStatus, self.suppress_status)] if suppress)
 
     def format_capdu(self, apdu: Apdu, inst: ApduCommand):
         """Output a single decoded + processed ApduCommand."""
-        if self.show_raw_apdu:
-            print(apdu)
-        print("%02u %-16s %-35s %-8s %s %s" % (inst.lchan_nr, inst._name, inst.path_str, inst.col_id,
-                                               inst.col_sw, json.dumps(inst.processed, cls=JsonEncoder)))
-        print("===============================")
+        # build the entire output for this APDU first and write it in one go
+        raw = "%s\n" % apdu if self.show_raw_apdu else ""
+        sys.stdout.write("%s%02u %-16s %-35s %-8s %s %s\n%s\n" % (raw, inst.lchan_nr, inst._name, inst.path_str,
+                                                                  inst.col_id, inst.col_sw,
+                                                                  json.dumps(inst.processed, cls=JsonEncoder),
+                                                                  SEPARATOR))
 
     def format_reset(self, apdu: CardReset):
         """Output a single decoded CardReset."""
-        print(apdu)
-        print("===============================")
+        sys.stdout.write("%s\n%s\n" % (apdu, SEPARATOR))
 
     def main(self):
         """Main loop of tracer: Iterates over all Apdu received from source."""
         apdu_counter = 0
+        # resolve everything used per APDU only once, outside of the loop
+        read_batch = self.source.read_batch
+        decode = self.ad.input
+        rs = self.rs
+        format_capdu = self.format_capdu
+        format_reset = self.format_reset
+        suppressed_types = self.suppressed_types
         while True:
-            # obtain the next APDU from the source (blocking read)
+            # obtain the next APDU(s) from the source (blocking read)
             try:
-                apdu = self.source.read()
-                apdu_counter = apdu_counter + 1
+                batch = read_batch()
             except StopIteration:
                 print("%i APDUs parsed, stop iteration." % apdu_counter)
                 return 0
 
-            if isinstance(apdu, CardReset):
-                self.rs.reset()
-                self.format_reset(apdu)
-                continue
+            for apdu in batch:
+                apdu_counter = apdu_counter + 1
+
+                if isinstance(apdu, CardReset):
+                    rs.reset()
+                    format_reset(apdu)
+                    continue
 
-            # ask ApduDecoder to look-up (INS,CLA) + instantiate an ApduCommand derived
-            # class like 'UiccSelect'
-            inst = self.ad.input(apdu)
-            # process the APDU (may modify the RuntimeState)
-            inst.process(self.rs)
+                # ask ApduDecoder to look-up (INS,CLA) + instantiate an ApduCommand derived
+                # class like 'UiccSelect'
+                inst = decode(apdu)
+                # process the APDU (may modify the RuntimeState)
+                inst.process(rs)
 
-            # Avoid cluttering the log with too much verbosity
-            if self.suppress_select and isinstance(inst, UiccSelect):
-                continue
-            if self.suppress_status and isinstance(inst, UiccStatus):
-                continue
+                # Avoid cluttering the log with too much verbosity
+                if isinstance(inst, suppressed_types):
+                    continue
 
-            self.format_capdu(apdu, inst)
+                format_capdu(apdu, inst)
 
 option_parser = argparse.ArgumentParser(description='Osmocom pySim high-level SIM card trace decoder',
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -154,6 +177,11 @@ global_group.add_argument('--no-suppress-status', action='store_false', dest='su
     information that was not already received in resposne to the most recent SEELCT.""")
 global_group.add_argument('--show-raw-apdu', action='store_true', dest='show_raw_apdu',
                           help="""Show the raw APDU in addition to its parsed form.""")
+global_group.add_argument('--read-ahead', type=int, default=0, metavar='N',
+                          help="""
+    Read and parse up to N APDUs from the source in a background thread, overlapping it with the
+    decoding + output of the preceding APDUs.  Mostly useful for the (slow) pyshark based sources.
+    0 disables the read-ahead.""")
 
 
 subparsers = option_parser.add_subparsers(help='APDU Source', dest='source', required=True)
@@ -208,8 +236,15 @@ if __name__ == '__main__':
     else:
         raise ValueError("unsupported source %s", opts.source)
 
+    if opts.read_ahead > 0:
+        s = ReadAheadApduSource(s, opts.read_ahead)
+
     tracer = Tracer(source=s, suppress_status=opts.suppress_status, suppress_select=opts.suppress_select,
                     show_raw_apdu=opts.show_raw_apdu)
     logger.info('Entering main loop...')
-    tracer.main()
+    try:
+        tracer.main()
+    finally:
+        if isinstance(s, ReadAheadApduSource):
+            s.close()
 
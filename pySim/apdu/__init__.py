@@ -48,6 +48,18 @@ from pySim.filesystem import CardADF, CardFile, TransparentEF, LinFixedEF
         * READ/UPDATE: requires state/context: which file is selected? how to decode it?
 """
 
+def expand_cla_list(cla_list: List[str]) -> frozenset:
+    """Expand a list of CLA match strings (like '8X', where 'X' is a wildcard nibble) into
+    the set of all CLA byte values matching any of them."""
+    res = set()
+    for cla_match in cla_list:
+        cla_match = cla_match.upper()
+        for cla in range(256):
+            cla_str = '%02X' % cla
+            if all(m in ('X', c) for m, c in zip(cla_match, cla_str)):
+                res.add(cla)
+    return frozenset(res)
+
 class ApduCommandMeta(abc.ABCMeta):
     """A meta-class that we can use to set some class variables when declaring
        a derived class of ApduCommand."""
@@ -56,6 +68,8 @@ class ApduCommandMeta(abc.ABCMeta):
         x._name = namespace.get('name', kwargs.get('n', None))
         x._ins = namespace.get('ins', kwargs.get('ins', None))
         x._cla = namespace.get('cla', kwargs.get('cla', None))
+        # pre-compute the set of matching CLA values once, so match_cla() is a simple set look-up
+        x._cla_values = expand_cla_list(x._cla) if x._cla else frozenset()
         return x
 
 BytesOrHex = typing.Union[bytes, Hexstr]
@@ -269,21 +283,11 @@ class ApduCommand(Apdu, metaclass=ApduCommandMeta):
     @classmethod
     def match_cla(cls, cla) -> bool:
         """Does the given CLA match the CLA list of the command?."""
-        if not isinstance(cla, str):
-            cla = '%02X' % cla
-        cla = cla.upper()
+        if isinstance(cla, str):
+            cla = int(cla, 16)
         # see https://github.com/PyCQA/pylint/issues/7219
         # pylint: disable=no-member
-        for cla_match in cls._cla:
-            cla_masked = ""
-            for i in range(0, 2):
-                if cla_match[i] == 'X':
-                    cla_masked += 'X'
-                else:
-                    cla_masked += cla[i]
-            if cla_masked == cla_match.upper():
-                return True
-        return False
+        return cla in cls._cla_values
 
     def cmd_to_dict(self) -> Dict:
         """Convert the Command part of the APDU to a dict."""
@@ -1,6 +1,8 @@
 import abc
 import logging
-from typing import Union
+import queue
+import threading
+from typing import Union, List, Optional
 from pySim.apdu import Apdu, Tpdu, CardReset, TpduFilter
 
 PacketType = Union[Apdu, Tpdu, CardReset]
@@ -15,20 +17,109 @@ class ApduSource(abc.ABC):
     def read_packet(self) -> PacketType:
         """Read one packet from the source."""
 
+    def _packet_to_apdu(self, r: Optional[PacketType]) -> Optional[Union[Apdu, CardReset]]:
+        """Process one packet returned by read_packet(); returns Apdu/CardReset or None if the packet
+        did not (yet) result in a complete APDU."""
+        if not r:
+            return None
+        if isinstance(r, Tpdu):
+            return self.apdu_filter.input_tpdu(r)
+        if isinstance(r, (Apdu, CardReset)):
+            return r
+        raise ValueError('Unknown read_packet() return %s' % r)
+
     def read(self) -> Union[Apdu, CardReset]:
         """Main function to call by the user: Blocking read, returns Apdu or CardReset."""
         apdu = None
         # loop until we actually have an APDU to return
         while not apdu:
-            r = self.read_packet()
-            if not r:
-                continue
-            if isinstance(r, Tpdu):
-                apdu = self.apdu_filter.input_tpdu(r)
-            elif isinstance(r, Apdu):
-                apdu = r
-            elif isinstance(r, CardReset):
-                apdu = r
-            else:
-                raise ValueError('Unknown read_packet() return %s' % r)
+            apdu = self._packet_to_apdu(self.read_packet())
         return apdu
+
+    def read_batch(self, max_n: int = 64) -> List[Union[Apdu, CardReset]]:
+        """Blocking read of at least one and at most max_n Apdu or CardReset.  Sources that can tell
+        whether more packets are immediately available override this to return all of them at once;
+        the default implementation simply returns the result of a single read()."""
+        return [self.read()]
+
+
+class ReadAheadApduSource(ApduSource):
+    """Wrapper around another ApduSource, which reads from it in a background thread.  This way the
+    (potentially expensive, e.g. tshark/pyshark based) reading + parsing of packets overlaps with the
+    decoding + output of the previous APDUs by the caller.  The order of APDUs is preserved."""
+    _EOF = object()
+
+    def __init__(self, source: ApduSource, depth: int = 256):
+        """
+        Args:
+            source: The ApduSource to read from
+            depth: Maximum number of APDUs read ahead of the consumer
+        """
+        super().__init__()
+        self.source = source
+        self.queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        # daemon thread: never keep the process alive just because the reader still waits for the source
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def _put(self, item) -> bool:
+        """Put an item into the queue, waiting for space unless we are asked to stop."""
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _reader(self):
+        try:
+            while not self._stop.is_set():
+                if not self._put(self.source.read()):
+                    break
+        except StopIteration:
+            self._put(self._EOF)
+        except Exception as e: # pylint: disable=broad-except
+            # hand over the exception to be re-raised in the context of the consumer
+            self._put(e)
+
+    def close(self, timeout: Optional[float] = 1.0):
+        """Stop reading ahead, e.g. once the consumer is no longer interested in further APDUs.  The
+        reader thread terminates as soon as its current read from the source returns."""
+        self._stop.set()
+        self.thread.join(timeout)
+
+    @staticmethod
+    def _is_final(item) -> bool:
+        return item is ReadAheadApduSource._EOF or isinstance(item, Exception)
+
+    def _raise_final(self, item):
+        # keep the final item in the queue, so any subsequent read raises again
+        self.queue.put(item)
+        if item is self._EOF:
+            raise StopIteration
+        raise item
+
+    def read_packet(self) -> PacketType:
+        return self.read()
+
+    def read(self) -> Union[Apdu, CardReset]:
+        item = self.queue.get()
+        if self._is_final(item):
+            self._raise_final(item)
+        return item
+
+    def read_batch(self, max_n: int = 64) -> List[Union[Apdu, CardReset]]:
+        batch = [self.read()]
+        while len(batch) < max_n:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_final(item):
+                # return what we have; the next read will raise
+                self.queue.put(item)
+                break
+            batch.append(item)
+        return batch
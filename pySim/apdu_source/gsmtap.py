@@ -15,6 +15,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import select
+import struct
+from typing import List, Optional, Union
 
 from osmocom.gsmtap import GsmtapReceiver
 
@@ -23,10 +26,18 @@ from pySim.apdu.ts_102_222 import ApduCommands as UiccAdmApduCommands
 from pySim.apdu.ts_31_102 import ApduCommands as UsimApduCommands
 from pySim.apdu.global_platform import ApduCommands as GpApduCommands
 
-from . import ApduSource, PacketType, CardReset
+from . import ApduSource, PacketType, CardReset, Apdu
 
 ApduCommands = UiccApduCommands + UiccAdmApduCommands + UsimApduCommands + GpApduCommands
 
+# fixed part of the GSMTAP v2 header: version, hdr_len (in 32bit words), type, [...], sub_type at offset 12
+GSMTAP_HDR = struct.Struct('!BBB9xB3x')
+GSMTAP_TYPE_SIM = 0x04
+GSMTAP_SIM_APDU = 0x00
+GSMTAP_SIM_ATR = 0x01
+GSMTAP_SIM_PPS_REQ = 0x02
+GSMTAP_SIM_PPS_RSP = 0x03
+
 class GsmtapApduSource(ApduSource):
     """ApduSource for handling GSMTAP-SIM messages received via UDP, such as
     those generated by simtrace2-sniff.  Note that *if* you use IP loopback
@@ -34,6 +45,9 @@ class GsmtapApduSource(ApduSource):
     this source before starting simtrace2-sniff, as otherwise the latter will
     claim the GSMTAP UDP port.
     """
+    # exception deferred by read_batch() to the next read_packet()
+    _pending_exc: Optional[Exception] = None
+
     def __init__(self, bind_ip:str='127.0.0.1', bind_port:int=4729):
         """Create a UDP socket for receiving GSMTAP-SIM messages.
         Args:
@@ -44,17 +58,44 @@ class GsmtapApduSource(ApduSource):
         self.gsmtap = GsmtapReceiver(bind_ip, bind_port)
 
     def read_packet(self) -> PacketType:
-        gsmtap_msg, _addr = self.gsmtap.read_packet()
-        if gsmtap_msg['type'] != 'sim':
-            raise ValueError('Unsupported GSMTAP type %s' % gsmtap_msg['type'])
-        sub_type = gsmtap_msg['sub_type']
-        if sub_type == 'apdu':
-            return ApduCommands.parse_cmd_bytes(gsmtap_msg['body'])
-        if sub_type == 'atr':
+        if self._pending_exc:
+            # error hit while draining the socket in read_batch(), after some APDUs were already read
+            exc, self._pending_exc = self._pending_exc, None
+            raise exc
+        # We only ever handle GSMTAP-SIM, so rather than decoding the entire header via
+        # osmocom.gsmtap.GsmtapMessage, we just unpack the few fields we need.
+        data, _addr = self.gsmtap.sock.recvfrom(65535)
+        version, hdr_len, gsmtap_type, sub_type = GSMTAP_HDR.unpack_from(data)
+        if version != 0x02:
+            raise ValueError('Unknown GSMTAP version 0x%02x' % version)
+        if gsmtap_type != GSMTAP_TYPE_SIM:
+            raise ValueError('Unsupported GSMTAP type 0x%02x' % gsmtap_type)
+        body = data[hdr_len*4:]
+        if sub_type == GSMTAP_SIM_APDU:
+            return ApduCommands.parse_cmd_bytes(body)
+        if sub_type == GSMTAP_SIM_ATR:
             # card has been reset
-            return CardReset(gsmtap_msg['body'])
-        if sub_type in ['pps_req', 'pps_rsp']:
+            return CardReset(body)
+        if sub_type in (GSMTAP_SIM_PPS_REQ, GSMTAP_SIM_PPS_RSP):
             # simply ignore for now
             pass
         else:
-            raise ValueError('Unsupported GSMTAP-SIM sub-type %s' % sub_type)
+            raise ValueError('Unsupported GSMTAP-SIM sub-type 0x%02x' % sub_type)
+
+    def read_batch(self, max_n: int = 64) -> List[Union[Apdu, CardReset]]:
+        """Blocking read of the next APDU, followed by non-blocking reads of all further APDUs
+        already queued on the socket (up to max_n in total)."""
+        batch = [self.read()]
+        sock = self.gsmtap.sock
+        try:
+            while len(batch) < max_n:
+                readable, _, _ = select.select([sock], [], [], 0)
+                if not readable:
+                    break
+                apdu = self._packet_to_apdu(self.read_packet())
+                if apdu:
+                    batch.append(apdu)
+        except Exception as e:
+            # don't lose the APDUs we already have; raise the error on the next read instead
+            self._pending_exc = e
+        return batch
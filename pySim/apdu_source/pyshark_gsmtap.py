@@ -84,5 +84,7 @@ class PysharkGsmtapPcap(_PysharkGsmtap):
         Args:
             pcap_filename: File name of the pcap file to be opened
         """
-        pyshark_inst = pyshark.FileCapture(pcap_filename, display_filter='gsm_sim', use_json=True, keep_packets=False)
+        # we only ever look at the UDP payload, so ask tshark to not serialize any other protocol layers
+        pyshark_inst = pyshark.FileCapture(pcap_filename, display_filter='gsm_sim', use_json=True, keep_packets=False,
+                                           custom_parameters=['-J', 'frame udp'])
         super().__init__(pyshark_inst)
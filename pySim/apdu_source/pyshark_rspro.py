@@ -26,6 +26,10 @@ from . import ApduSource, PacketType, CardReset
 
 logger = logging.getLogger(__name__)
 
+# we only ever look at the RSPRO layer, so ask tshark to not serialize any other protocol layers
+# ('frame' is always required by pyshark to construct its Packet objects)
+RSPRO_TSHARK_PARAMS = ['-J', 'frame rspro']
+
 class _PysharkRspro(ApduSource):
     """APDU Source [provider] base class for reading RSPRO (osmo-remsim) via tshark."""
 
@@ -135,7 +139,8 @@ class PysharkRsproPcap(_PysharkRspro):
         Args:
             pcap_filename: File name of the pcap file to be opened
         """
-        pyshark_inst = pyshark.FileCapture(pcap_filename, display_filter='rspro', use_json=True, keep_packets=False)
+        pyshark_inst = pyshark.FileCapture(pcap_filename, display_filter='rspro', use_json=True, keep_packets=False,
+                                           custom_parameters=RSPRO_TSHARK_PARAMS)
         super().__init__(pyshark_inst)
 
 class PysharkRsproLive(_PysharkRspro):
@@ -154,5 +159,5 @@ class PysharkRsproLive(_PysharkRspro):
             bfp_filter: libpcap capture filter to use
         """
         pyshark_inst = pyshark.LiveCapture(interface=interface, display_filter='rspro', bpf_filter=bpf_filter,
-                                           use_json=True)
+                                           use_json=True, custom_parameters=RSPRO_TSHARK_PARAMS)
         super().__init__(pyshark_inst)
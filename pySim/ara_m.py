@@ -25,12 +25,13 @@ Support for the Secure Element Access Control, specifically the ARA-M inside an
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from functools import lru_cache
+import struct
 
 from construct import GreedyString, Struct, Enum, Int8ub, Int16ub
 from construct import Optional as COptional
 from osmocom.construct import *
 from osmocom.tlv import *
-from osmocom.utils import Hexstr
 from pySim.filesystem import *
 import pySim.global_platform
 
@@ -64,6 +65,12 @@ class RefDO(BER_TLV_IE, tag=0xe1, nested=[AidRefDO, AidRefEmptyDO, DevAppIdRefDO
 
 class ApduArDO(BER_TLV_IE, tag=0xd0):
     # GPD_SPE_013 v1.1 Table 6-8
+    _test_de_encode = [
+        ( 'd00100', {'generic_access_rule': 'never'} ),
+        ( 'd00101', {'generic_access_rule': 'always'} ),
+        ( 'd010a0a40000ffff000080ca0000ffff0000', {'apdu_filter': [{'header': 'a0a40000', 'mask': 'ffff0000'},
+                                                                   {'header': '80ca0000', 'mask': 'ffff0000'}]} ),
+    ]
     def _from_bytes(self, do: bytes):
         if len(do) == 1:
             if do[0] == 0x00:
@@ -72,16 +79,13 @@ class ApduArDO(BER_TLV_IE, tag=0xd0):
             if do[0] == 0x01:
                 self.decoded = {'generic_access_rule': 'always'}
                 return self.decoded
-            return ValueError('Invalid 1-byte generic APDU access rule')
+            raise ValueError('Invalid 1-byte generic APDU access rule')
         else:
             if len(do) % 8:
-                return ValueError('Invalid non-modulo-8 length of APDU filter: %d' % len(do))
-            self.decoded = {'apdu_filter': []}
-            offset = 0
-            while offset < len(do):
-                self.decoded['apdu_filter'] += [{'header': b2h(do[offset:offset+4]),
-                                                'mask': b2h(do[offset+4:offset+8])}]
-                offset += 8 # Move offset to the beginning of the next apdu_filter object
+                raise ValueError('Invalid non-modulo-8 length of APDU filter: %d' % len(do))
+            # split the DO into 8-byte (header, mask) filter objects
+            self.decoded = {'apdu_filter': [{'header': b2h(header), 'mask': b2h(mask)}
+                                            for header, mask in struct.iter_unpack('4s4s', do)]}
             return self.decoded
 
     def _to_bytes(self):
@@ -90,21 +94,50 @@ class ApduArDO(BER_TLV_IE, tag=0xd0):
                 return b'\x00'
             if self.decoded['generic_access_rule'] == 'always':
                 return b'\x01'
-            return ValueError('Invalid 1-byte generic APDU access rule')
+            raise ValueError('Invalid 1-byte generic APDU access rule')
         else:
             if not 'apdu_filter' in self.decoded:
-                return ValueError('Invalid APDU AR DO')
+                raise ValueError('Invalid APDU AR DO')
             filters = self.decoded['apdu_filter']
-            res = b''
+            res = []
             for f in filters:
                 if not 'header' in f or not 'mask' in f:
-                    return ValueError('APDU filter must contain header and mask')
-                header_b = h2b(f['header'])
-                mask_b = h2b(f['mask'])
+                    raise ValueError('APDU filter must contain header and mask')
+                header_b = bytes.fromhex(f['header'])
+                mask_b = bytes.fromhex(f['mask'])
                 if len(header_b) != 4 or len(mask_b) != 4:
-                    return ValueError('APDU filter header and mask must each be 4 bytes')
-                res += header_b + mask_b
-            return res
+                    raise ValueError('APDU filter header and mask must each be 4 bytes')
+                res += [header_b, mask_b]
+            return b''.join(res)
+
+    def _filter_masks(self):
+        """Return the APDU filters as tuple of (masked header, mask) integer pairs, converted only once
+        for any given decoded filter list."""
+        filters = self.decoded['apdu_filter']
+        cached = getattr(self, '_filter_cache', None)
+        if cached is None or cached[0] is not filters:
+            masks = []
+            for f in filters:
+                mask = int(f['mask'], 16)
+                masks.append((int(f['header'], 16) & mask, mask))
+            cached = (filters, tuple(masks))
+            self._filter_cache = cached
+        return cached[1]
+
+    def match(self, apdu_hdr: int) -> bool:
+        """Check if an APDU is permitted by this access rule.
+
+        Args:
+            apdu_hdr : 32-bit integer of the APDU header bytes CLA, INS, P1, P2
+        Returns:
+            True if the APDU is permitted, False otherwise
+        """
+        if 'generic_access_rule' in self.decoded:
+            return self.decoded['generic_access_rule'] == 'always'
+        for header, mask in self._filter_masks():
+            if apdu_hdr & mask == header:
+                return True
+        return False
 
 
 class NfcArDO(BER_TLV_IE, tag=0xd1):
@@ -224,6 +257,13 @@ class BlockDO(BER_TLV_IE, tag=0xe7):
     _construct = Struct('offset'/Int16ub, 'length'/Int8ub)
 
 
+# compile the constructs of the leaf DOs once at import time, so that the first STORE DATA / GET DATA
+# of a session doesn't have to pay for it and all further (de)coding uses the faster compiled parser
+for _cls in [AidRefDO, DevAppIdRefDO, PkgRefDO, NfcArDO, PermArDO, ResponseRefreshTagDO,
+             DeviceInterfaceVersionDO, BlockDO]:
+    _cls._construct = _cls._construct.compile()
+
+
 # GPD_SPE_013 v1.1 Table 4-1
 class GetCommandDoCollection(TLV_IE_Collection, nested=[RefDO, DeviceConfigDO]):
     pass
@@ -250,6 +290,12 @@ class StoreResponseDoCollection(TLV_IE_Collection,
     pass
 
 
+# CLA/INS/P1/P2 of the commands exchanged with the ARA-M
+_HDR_STORE_DATA = bytes.fromhex('80e29000')
+_HDR_GET_DATA_ALL = bytes.fromhex('80caff40')
+_HDR_GET_DATA_CONFIG = bytes.fromhex('80cadf21')
+
+
 class ADF_ARAM(CardADF):
     def __init__(self, aid='a00000015141434c00', name='ADF.ARA-M', fid=None, sfid=None,
                  desc='ARA-M Application'):
@@ -262,23 +308,23 @@ class ADF_ARAM(CardADF):
         return pySim.global_platform.decode_select_response(data_hex)
 
     @staticmethod
-    def xceive_apdu_tlv(scc, hdr: Hexstr, cmd_do, resp_cls, exp_sw='9000'):
+    def xceive_apdu_tlv(scc, hdr: bytes, cmd_do, resp_cls, exp_sw='9000'):
         """Transceive an APDU with the card, transparently encoding the command data from TLV
-        and decoding the response data tlv."""
+        (or using it as-is, if already encoded) and decoding the response data tlv."""
         if cmd_do:
-            cmd_do_enc = cmd_do.to_ie()
+            cmd_do_enc = cmd_do if isinstance(cmd_do, bytes) else cmd_do.to_ie()
             cmd_do_len = len(cmd_do_enc)
             if cmd_do_len > 255:
-                return ValueError('DO > 255 bytes not supported yet')
+                raise ValueError('DO > 255 bytes not supported yet')
         else:
             cmd_do_enc = b''
             cmd_do_len = 0
-        c_apdu = hdr + ('%02x' % cmd_do_len) + b2h(cmd_do_enc)
+        c_apdu = b2h(hdr + bytes([cmd_do_len]) + cmd_do_enc)
         (data, _sw) = scc.send_apdu_checksw(c_apdu, exp_sw)
         if data:
             if resp_cls:
                 resp_do = resp_cls()
-                resp_do.from_tlv(h2b(data))
+                resp_do.from_tlv(bytes.fromhex(data))
                 return resp_do
             return data
         else:
@@ -287,18 +333,26 @@ class ADF_ARAM(CardADF):
     @staticmethod
     def store_data(scc, do) -> bytes:
         """Build the Command APDU for STORE DATA."""
-        return ADF_ARAM.xceive_apdu_tlv(scc, '80e29000', do, StoreResponseDoCollection)
+        return ADF_ARAM.xceive_apdu_tlv(scc, _HDR_STORE_DATA, do, StoreResponseDoCollection)
 
     @staticmethod
     def get_all(scc):
-        return ADF_ARAM.xceive_apdu_tlv(scc, '80caff40', None, GetResponseDoCollection)
+        return ADF_ARAM.xceive_apdu_tlv(scc, _HDR_GET_DATA_ALL, None, GetResponseDoCollection)
 
     @staticmethod
-    def get_config(scc, v_major=0, v_minor=0, v_patch=1):
+    @lru_cache(maxsize=8)
+    def _encode_config_do(v_major: int, v_minor: int, v_patch: int) -> bytes:
+        """Encode the DeviceConfigDO for a given interface version; the result only depends on the
+        version, so it is computed only once."""
         cmd_do = DeviceConfigDO()
         cmd_do.from_val_dict([{'device_interface_version_do': {
                                'major': v_major, 'minor': v_minor, 'patch': v_patch}}])
-        return ADF_ARAM.xceive_apdu_tlv(scc, '80cadf21', cmd_do, ResponseAramConfigDO)
+        return cmd_do.to_ie()
+
+    @staticmethod
+    def get_config(scc, v_major=0, v_minor=0, v_patch=1):
+        cmd_do_enc = ADF_ARAM._encode_config_do(v_major, v_minor, v_patch)
+        return ADF_ARAM.xceive_apdu_tlv(scc, _HDR_GET_DATA_CONFIG, cmd_do_enc, ResponseAramConfigDO)
 
     @with_default_category('Application-Specific Commands')
     class AddlShellCommands(CommandSet):
@@ -347,34 +401,32 @@ class ADF_ARAM(CardADF):
             # REF
             ref_do_content = []
             if opts.aid is not None:
-                ref_do_content += [{'aid_ref_do': opts.aid}]
+                ref_do_content.append({'aid_ref_do': opts.aid})
             elif opts.aid_empty:
-                ref_do_content += [{'aid_ref_empty_do': None}]
-            ref_do_content += [{'dev_app_id_ref_do': opts.device_app_id}]
+                ref_do_content.append({'aid_ref_empty_do': None})
+            ref_do_content.append({'dev_app_id_ref_do': opts.device_app_id})
             if opts.pkg_ref:
-                ref_do_content += [{'pkg_ref_do': {'package_name_string': opts.pkg_ref}}]
+                ref_do_content.append({'pkg_ref_do': {'package_name_string': opts.pkg_ref}})
             # AR
             ar_do_content = []
             if opts.apdu_never:
-                ar_do_content += [{'apdu_ar_do': {'generic_access_rule': 'never'}}]
+                ar_do_content.append({'apdu_ar_do': {'generic_access_rule': 'never'}})
             elif opts.apdu_always:
-                ar_do_content += [{'apdu_ar_do': {'generic_access_rule': 'always'}}]
+                ar_do_content.append({'apdu_ar_do': {'generic_access_rule': 'always'}})
             elif opts.apdu_filter:
-                if len(opts.apdu_filter) % 16:
-                    return ValueError('Invalid non-modulo-16 length of APDU filter: %d' % len(do))
-                offset = 0
-                apdu_filter = []
-                while offset < len(opts.apdu_filter):
-                    apdu_filter += [{'header': opts.apdu_filter[offset:offset+8],
-                                     'mask': opts.apdu_filter[offset+8:offset+16]}]
-                    offset += 16 # Move offset to the beginning of the next apdu_filter object
-                ar_do_content += [{'apdu_ar_do': {'apdu_filter': apdu_filter}}]
+                apdu_filter_hex = opts.apdu_filter
+                if len(apdu_filter_hex) % 16:
+                    raise ValueError('Invalid non-modulo-16 length of APDU filter: %d' % len(apdu_filter_hex))
+                # each apdu_filter object is 8 bytes (16 hex digits): 4 byte header followed by 4 byte mask
+                apdu_filter = [{'header': apdu_filter_hex[i:i+8], 'mask': apdu_filter_hex[i+8:i+16]}
+                               for i in range(0, len(apdu_filter_hex), 16)]
+                ar_do_content.append({'apdu_ar_do': {'apdu_filter': apdu_filter}})
             if opts.nfc_always:
-                ar_do_content += [{'nfc_ar_do': {'nfc_event_access_rule': 'always'}}]
+                ar_do_content.append({'nfc_ar_do': {'nfc_event_access_rule': 'always'}})
             elif opts.nfc_never:
-                ar_do_content += [{'nfc_ar_do': {'nfc_event_access_rule': 'never'}}]
+                ar_do_content.append({'nfc_ar_do': {'nfc_event_access_rule': 'never'}})
             if opts.android_permissions:
-                ar_do_content += [{'perm_ar_do': {'permissions': opts.android_permissions}}]
+                ar_do_content.append({'perm_ar_do': {'permissions': opts.android_permissions}})
             d = [{'ref_ar_do': [{'ref_do': ref_do_content}, {'ar_do': ar_do_content}]}]
             csrado = CommandStoreRefArDO()
             csrado.from_val_dict(d)
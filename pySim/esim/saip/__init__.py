@@ -181,19 +181,13 @@ class File:
         self.fid = template.fid
         self.sfi = template.sfi
         self.arr = template.arr.to_bytes(1)
-        if hasattr(template, 'rec_len'):
-            self.rec_len = template.rec_len
-        else:
-            self.rec_len = None
-        if hasattr(template, 'nb_rec'):
-            self.nb_rec = template.nb_rec
-        else:
-            self.nb_rec = None
+        self.rec_len = template.rec_len
+        self.nb_rec = template.nb_rec
         self.high_update = template.high_update
         # All the files defined in the templates shall have, by default, shareable/not-shareable bit in the file descriptor set to "shareable".
         self.shareable = True
         self._template_derived = True
-        if hasattr(template, 'file_size'):
+        if template.file_type in ['TR', 'BT']:
             self._file_size = template.file_size
 
     def _recompute_size(self):
@@ -588,12 +582,7 @@ class FsProfileElement(ProfileElement):
             adf: string name of the ADF which might be used with this PE
         """
         template = templates.ProfileTemplateRegistry.get_by_oid(self.templateID)
-        for f in template.files:
-            if f.path == path:
-                return f
-            # optionally prefix with ADF name of NAA
-            if adf and Path(adf) + f.path == path:
-                return f
+        return template.file_by_path(path, adf)
 
     def supports_file_for_path(self, path: Path, adf: Optional[str] = None) -> bool:
         """Does this ProfileElement support a file of given path?"""
@@ -15,19 +15,58 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
+from types import MappingProxyType
 from typing import *
-from copy import deepcopy
-from pySim.utils import all_subclasses, h2b
+from functools import lru_cache
+from pySim.utils import all_subclasses
 from pySim.filesystem import Path
 import pySim.esim.saip.oid as OID
 
+# translation table for deriving the PE name from the file name: 'EF.FOO_BAR' -> 'ef-foo-bar'
+_PE_NAME_TRANS = str.maketrans('._', '--')
+
+# file types: directories, record-oriented EFs and EFs with a file size
+_DF_TYPES = frozenset(('MF', 'DF', 'ADF'))
+_RECORD_EF_TYPES = frozenset(('LF', 'CY'))
+_SIZED_EF_TYPES = frozenset(('TR', 'BT'))
+
+# sys.intern() only works on str; this is the equivalent for the parameter name tuples, of which the
+# same few ('size', 'nb_rec'+'size', 'pinStatusTemplateDO', ...) are used by hundreds of FileTemplates.
+_PARAMS_INTERN: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+@lru_cache(maxsize=None)
+def _parse_pattern(pattern: str) -> Tuple[bytes, Optional[bytes]]:
+    """Parse a default value pattern; see FileTemplate._parse_default_value_pattern().  There are only a few
+    dozen distinct patterns, so all templates using the same pattern share the resulting bytes."""
+    if not '...' in pattern:
+        return (bytes.fromhex(pattern), None)
+    l = pattern.split('...')
+    if len(l) != 2:
+        raise ValueError("Pattern '%s' contains more than one ..." % pattern)
+    return (bytes.fromhex(l[0]), bytes.fromhex(l[1]))
+
+@lru_cache(maxsize=256)
+def _expand_pattern(prefix: bytes, suffix: bytes, length: int) -> bytes:
+    """Expand a parsed 'prefix...suffix' default value pattern to the given length, by repeating the last
+    byte of the prefix.  Many files share the same pattern and size, so the (immutable) result is cached."""
+    pad_len = length - len(prefix) - len(suffix)
+    if pad_len <= 0:
+        ret = prefix + suffix
+        return ret[:length]
+    return prefix + prefix[-1:] * pad_len + suffix
+
 class FileTemplate:
     """Representation of a single file in a SimAlliance/TCA Profile Template. The argument order
     is done to match that of the tables in Section 9 of the SAIP specification."""
+    __slots__ = ('fid', 'name', 'pe_name', 'file_type', 'nb_rec', 'rec_len', 'file_size', 'arr', 'sfi',
+                 'default_val', 'default_val_repeat', 'content_rqd', 'params', 'ass_serv', 'high_update',
+                 'ppath', 'parent', 'children', '_default_val_parts')
+
     def __init__(self, fid:int, name:str, ftype, nb_rec: Optional[int], size:Optional[int], arr:int,
                  sfi:Optional[int] = None, default_val:Optional[str] = None, content_rqd:bool = True,
-                 params:Optional[List] = None, ass_serv:Optional[List[int]]=None, high_update:bool = False,
-                 pe_name:Optional[str] = None, repeat:bool = False, ppath: List[int] = []):
+                 params:Optional[Sequence[str]] = None, ass_serv:Optional[List[int]]=None, high_update:bool = False,
+                 pe_name:Optional[str] = None, repeat:bool = False, ppath: Optional[List[int]] = None):
         """
         Args:
             fid: The 16bit file-identifier of the file
@@ -50,32 +89,49 @@ class FileTemplate:
         # initialize from arguments
         self.fid = fid
         self.name = name
+        # the PE names and default value patterns repeat a lot across the templates; intern them so
+        # that all instances share one string object each (which also makes comparisons cheaper)
         if pe_name:
-            self.pe_name = pe_name
+            self.pe_name = sys.intern(pe_name)
         else:
-            self.pe_name = self.name.replace('.','-').replace('_','-').lower()
+            self.pe_name = sys.intern(self.name.translate(_PE_NAME_TRANS).lower())
         self.file_type = ftype
-        if ftype in ['LF', 'CY']:
+        # nb_rec/rec_len only apply to record-oriented, file_size only to transparent/BER-TLV files
+        self.nb_rec = None
+        self.rec_len = None
+        self.file_size = None
+        if ftype in _RECORD_EF_TYPES:
             self.nb_rec = nb_rec
             self.rec_len = size
-        elif ftype in ['TR', 'BT']:
+        elif ftype in _SIZED_EF_TYPES:
             self.file_size = size
         self.arr = arr
         self.sfi = sfi
-        self.default_val = default_val
+        self.default_val = sys.intern(default_val) if default_val else default_val
         self.default_val_repeat = repeat
         self.content_rqd = content_rqd
+        if params is not None:
+            params = tuple(params)
+            params = _PARAMS_INTERN.setdefault(params, params)
         self.params = params
         self.ass_serv = ass_serv
         self.high_update = high_update
-        self.ppath = ppath # parent path, if this FileTemplate is not immediately below the base_df
+        self.ppath = ppath or [] # parent path, if this FileTemplate is not immediately below the base_df
         # initialize empty
         self.parent = None
         self.children = []
-        if self.default_val:
-            length = self._default_value_len() or 100
-            # run the method once to verify the pattern can be processed
-            self.expand_default_value_pattern(length)
+        # parse the default value pattern only once; this also verifies the pattern can be processed
+        self._default_val_parts = self._parse_default_value_pattern()
+
+    def clone(self) -> 'FileTemplate':
+        """Return a copy of this FileTemplate which is not (yet) part of any file tree.  Much cheaper than
+        a deepcopy(), as all other attributes are never modified after construction and can be shared."""
+        c = FileTemplate.__new__(FileTemplate)
+        for attr in self.__slots__:
+            setattr(c, attr, getattr(self, attr))
+        c.parent = None
+        c.children = []
+        return c
 
     def __str__(self) -> str:
         return "FileTemplate(%s)" % (self.name)
@@ -110,31 +166,30 @@ class FileTemplate:
                 return c.get_file_by_path(path[1:])
 
     def _default_value_len(self):
-        if self.file_type in ['TR']:
+        if self.file_type == 'TR':
             return self.file_size
-        elif self.file_type in ['LF', 'CY']:
+        elif self.file_type in _RECORD_EF_TYPES:
             return self.rec_len
 
+    def _parse_default_value_pattern(self) -> Optional[Tuple[bytes, Optional[bytes]]]:
+        """Parse the default value pattern into (prefix, suffix) around the '...'; suffix is None if the
+        pattern has no '...' and hence is to be used as-is."""
+        if not self.default_val:
+            return None
+        return _parse_pattern(self.default_val)
+
     def expand_default_value_pattern(self, length: Optional[int] = None) -> Optional[bytes]:
         """Expand the default value pattern to the specified length."""
         if length is None:
             length = self._default_value_len()
         if length is None:
             raise ValueError("%s does not have a default length" % self)
-        if not self.default_val:
+        if not self._default_val_parts:
             return None
-        if not '...' in self.default_val:
-            return h2b(self.default_val)
-        l = self.default_val.split('...')
-        if len(l) != 2:
-            raise ValueError("Pattern '%s' contains more than one ..." % self.default_val)
-        prefix = h2b(l[0])
-        suffix = h2b(l[1])
-        pad_len = length - len(prefix) - len(suffix)
-        if pad_len <= 0:
-            ret = prefix + suffix
-            return ret[:length]
-        return prefix + prefix[-1:] * pad_len + suffix
+        prefix, suffix = self._default_val_parts
+        if suffix is None:
+            return prefix
+        return _expand_pattern(prefix, suffix, length)
 
 
 class ProfileTemplate:
@@ -144,7 +199,9 @@ class ProfileTemplate:
     created_by_default: bool = False
     optional: bool = False
     oid: Optional[OID.eOID] = None
-    files: List[FileTemplate] = []
+    # to be defined by each derived class and frozen into a tuple once the class is created;
+    # deliberately no (shared, mutable) default here
+    files: Sequence[FileTemplate]
 
     # indicates that a given template does not have its own 'base DF', but that its contents merely
     # extends that of the 'base DF' of another template
@@ -157,15 +214,18 @@ class ProfileTemplate:
         """This classmethod is called automatically after executing the subclass body. We use it to
         initialize the cls.files_by_pename from the cls.files"""
         super().__init_subclass__(**kwargs)
+        # intermediate (abstract) classes without an OID are neither complete nor registered
+        if cls.oid is None:
+            return
         cur_df = None
 
-        cls.files_by_pename: dict[str,FileTemplate] = {}
+        cls.files = tuple(cls.files)
         cls.tree: List[FileTemplate] = []
 
-        if not cls.optional and not cls.files[0].file_type in ['MF', 'DF', 'ADF']:
+        if not cls.optional and not cls.files[0].file_type in _DF_TYPES:
             raise ValueError('First file in non-optional template must be MF, DF or ADF (is: %s)' % cls.files[0])
         for f in cls.files:
-            if f.file_type in ['MF', 'DF', 'ADF']:
+            if f.file_type in _DF_TYPES:
                 if cur_df == None:
                     cls.tree.append(f)
                     f.parent = None
@@ -184,9 +244,46 @@ class ProfileTemplate:
                 else:
                     cur_df.children.append(f)
                     f.parent = cur_df
-            cls.files_by_pename[f.pe_name] = f
+        cls.files_by_pename: dict[str,FileTemplate] = {f.pe_name: f for f in cls.files}
+        # stringify the OID only once; it is the key for the ProfileTemplateRegistry
+        cls._oid_str = str(cls.oid)
         ProfileTemplateRegistry.add(cls)
 
+    @classmethod
+    def _files_by_path(cls) -> Dict[Tuple[str, ...], Tuple[int, FileTemplate]]:
+        """Return the index of our files by path (as tuple of its components), mapping to a tuple of
+        (position in cls.files, FileTemplate); in case of duplicates, the first file wins.  Only few
+        templates are ever looked up by path, so the index is built on first use and then cached in the
+        class itself (not inherited by derived classes)."""
+        idx = cls.__dict__.get('_path_index', None)
+        if idx is None:
+            idx = {}
+            for i, f in enumerate(cls.files):
+                idx.setdefault(tuple(f.path.list), (i, f))
+            cls._path_index = idx
+        return idx
+
+    @classmethod
+    def file_by_path(cls, path: Path, adf: Optional[str] = None) -> Optional[FileTemplate]:
+        """Return the FileTemplate for the given path, if any.
+
+        Args:
+            path: the path for which we would like to resolve the FileTemplate
+            adf: string name of the ADF which might be used as prefix to the path of the file
+        """
+        files_by_path = cls._files_by_path()
+        key = tuple(path.list)
+        found = files_by_path.get(key, None)
+        if adf:
+            # optionally prefixed with ADF name of NAA
+            adf_key = tuple(Path(adf).list)
+            if key[:len(adf_key)] == adf_key:
+                found_adf = files_by_path.get(key[len(adf_key):], None)
+                # whichever comes first in cls.files wins
+                if found_adf and (not found or found_adf[0] < found[0]):
+                    found = found_adf
+        return found[1] if found else None
+
     @classmethod
     def print_tree(cls):
         for c in cls.tree:
@@ -203,23 +300,34 @@ class ProfileTemplate:
 class ProfileTemplateRegistry:
     """A registry of profile templates.  Exists as a singleton class with no instances and only
     classmethods."""
-    by_oid = {}
+    _by_oid: Dict[str, Type[ProfileTemplate]] = {}
+    # read-only view for users of the registry; use add() to register templates
+    by_oid = MappingProxyType(_by_oid)
 
     @classmethod
     def add(cls, tpl: ProfileTemplate):
         """Add a ProfileTemplate to the registry.  There can only be one Template per OID."""
-        oid_str = str(tpl.oid)
-        if oid_str in cls.by_oid:
+        oid_str = tpl._oid_str
+        if cls._by_oid.setdefault(oid_str, tpl) is not tpl:
             raise ValueError("We already have a template for OID %s" % oid_str)
-        cls.by_oid[oid_str] = tpl
 
     @classmethod
     def get_by_oid(cls, oid: Union[List[int], str]) -> Optional[ProfileTemplate]:
         """Look-up the ProfileTemplate based on its OID.  The OID can be given either in dotted-string format,
         or as a list of integers."""
         if not isinstance(oid, str):
-            oid = OID.OID.str_from_intlist(oid)
-        return cls.by_oid.get(oid, None)
+            oid = _oid_str_from_intlist(tuple(oid))
+        return cls._by_oid.get(oid, None)
+
+@lru_cache(maxsize=64)
+def _oid_str_from_intlist(intlist: Tuple[int]) -> str:
+    """Convert an OID given as tuple of integers to its dotted string representation (cached)."""
+    return OID.OID.str_from_intlist(intlist)
+
+def _file_range(fids: range, *args, **kwargs) -> List[FileTemplate]:
+    """Create one FileTemplate (with otherwise identical arguments) for each FID in the given range; used
+    for the ranges of files like EF.ICON, EF.IIDF or the phonebook EFs in the templates below."""
+    return [FileTemplate(fid, *args, **kwargs) for fid in fids]
 
 # below are transcribed template definitions from "ANNEX A (Normative): File Structure Templates Definition"
 # of "Profile interoperability specification V3.3.1 Final" (unless other version explicitly specified).
@@ -246,46 +354,30 @@ class FilesCD(ProfileTemplate):
         FileTemplate(0x7f11, 'DF.CD',        'DF', None, None,  14, None, None, False, params=['pinStatusTemplateDO']),
         FileTemplate(0x6f01, 'EF.LAUNCHPAD', 'TR', None, None,   2, None, None, True, params=['size']),
     ]
-    for i in range(0x40, 0x7f):
-        files.append(FileTemplate(0x6f00+i, 'EF.ICON',      'TR', None, None,   2, None, None, True, params=['size']))
+    files += _file_range(range(0x6f40, 0x6f7f), 'EF.ICON',      'TR', None, None,   2, None, None, True, params=['size'])
 
 
 # Section 9.4: Do this separately, so we can use them also from 9.5.3
 df_pb_files = [
     FileTemplate(0x5f3a, 'DF.PHONEBOOK', 'DF', None, None,  14, None, None, True, ['pinStatusTemplateDO']),
     FileTemplate(0x4f30, 'EF.PBR',       'LF', None, None,   2, None, None, True, ['nb_rec', 'size'], ppath=[0x5f3a]),
-]
-for i in range(0x38, 0x40):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.EXT1', 'LF', None,   13,  5, None, '00FF...FF', False, ['size','sfi'], ppath=[0x5f3a]))
-for i in range(0x40, 0x48):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.AAS', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size'], ppath=[0x5f3a]))
-for i in range(0x48, 0x50):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.GAS', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size'], ppath=[0x5f3a]))
-df_pb_files += [
+    *_file_range(range(0x4f38, 0x4f40), 'EF.EXT1', 'LF', None,   13,  5, None, '00FF...FF', False, ['size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f40, 0x4f48), 'EF.AAS', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f48, 0x4f50), 'EF.GAS', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size'], ppath=[0x5f3a]),
     FileTemplate(0x4f22, 'EF.PSC',       'TR', None,    4,   5, None, '00000000', False, ['sfi'], ppath=[0x5f3a]),
     FileTemplate(0x4f23, 'EF.CC',        'TR', None,    2,   5, None, '0000', False, ['sfi'], high_update=True, ppath=[0x5f3a]),
     FileTemplate(0x4f24, 'EF.PUID',      'TR', None,    2,   5, None, '0000', False, ['sfi'], high_update=True, ppath=[0x5f3a]),
+    *_file_range(range(0x4f50, 0x4f58), 'EF.IAP', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f58, 0x4f60), 'EF.ADN', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f60, 0x4f68), 'EF.ADN', 'LF', None,    2,  5, None, '00...00', False, ['nb_rec','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f68, 0x4f70), 'EF.ANR', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f70, 0x4f78), 'EF.PURI', 'LF', None, None,  5, None, None, True, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f78, 0x4f80), 'EF.EMAIL', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f80, 0x4f88), 'EF.SNE', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f88, 0x4f90), 'EF.UID', 'LF', None,    2,  5, None, '0000', False, ['nb_rec','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f90, 0x4f98), 'EF.GRP', 'LF', None, None,  5, None, '00...00', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
+    *_file_range(range(0x4f98, 0x4fa0), 'EF.CCP1', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]),
 ]
-for i in range(0x50, 0x58):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.IAP', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x58, 0x60):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.ADN', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x60, 0x68):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.ADN', 'LF', None,    2,  5, None, '00...00', False, ['nb_rec','sfi'], ppath=[0x5f3a]))
-for i in range(0x68, 0x70):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.ANR', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x70, 0x78):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.PURI', 'LF', None, None,  5, None, None, True, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x78, 0x80):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.EMAIL', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x80, 0x88):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.SNE', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x88, 0x90):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.UID', 'LF', None,    2,  5, None, '0000', False, ['nb_rec','sfi'], ppath=[0x5f3a]))
-for i in range(0x90, 0x98):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.GRP', 'LF', None, None,  5, None, '00...00', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
-for i in range(0x98, 0xa0):
-    df_pb_files.append(FileTemplate(0x4f00+i, 'EF.CCP1', 'LF', None, None,  5, None, 'FF...FF', False, ['nb_rec','size','sfi'], ppath=[0x5f3a]))
 
 # Section 9.4 v2.3.1
 class FilesTelecom(ProfileTemplate):
@@ -307,13 +399,11 @@ class FilesTelecom(ProfileTemplate):
         FileTemplate(0x4f01, 'EF.LAUNCH_SCWS','TR',None, None,  10, None, None, True, ['size'], ppath=[0x5f50]),
         # EF.ICON below
     ]
-    for i in range(0x40, 0x80):
-        files.append(FileTemplate(0x4f00+i, 'EF.IIDF', 'TR', None, None, 2, None, 'FF...FF', False, ['size'], ppath=[0x5f50]))
-    for i in range(0x80, 0xC0):
-        files.append(FileTemplate(0x4f00+i, 'EF.ICON', 'TR', None, None, 10, None, None, True, ['size'], ppath=[0x5f50]))
+    files += _file_range(range(0x4f40, 0x4f80), 'EF.IIDF', 'TR', None, None, 2, None, 'FF...FF', False, ['size'], ppath=[0x5f50])
+    files += _file_range(range(0x4f80, 0x4fc0), 'EF.ICON', 'TR', None, None, 10, None, None, True, ['size'], ppath=[0x5f50])
 
     # we copy the objects (instances) here as we also use them below from FilesUsimDfPhonebook
-    df_pb = deepcopy(df_pb_files)
+    df_pb = [f.clone() for f in df_pb_files]
     files += df_pb
 
     files += [
@@ -348,13 +438,11 @@ class FilesTelecomV2(ProfileTemplate):
         FileTemplate(0x4f01, 'EF.LAUNCH_SCWS','TR',None, None,  10, None, None, True, ['size'], ppath=[0x5f50]),
         # EF.ICON below
     ]
-    for i in range(0x40, 0x80):
-        files.append(FileTemplate(0x4f00+i, 'EF.IIDF', 'TR', None, None, 2, None, 'FF...FF', False, ['size'], ppath=[0x5f50]))
-    for i in range(0x80, 0xC0):
-        files.append(FileTemplate(0x4f00+i, 'EF.ICON', 'TR', None, None, 10, None, None, True, ['size'],ppath=[0x5f50]))
+    files += _file_range(range(0x4f40, 0x4f80), 'EF.IIDF', 'TR', None, None, 2, None, 'FF...FF', False, ['size'], ppath=[0x5f50])
+    files += _file_range(range(0x4f80, 0x4fc0), 'EF.ICON', 'TR', None, None, 10, None, None, True, ['size'],ppath=[0x5f50])
 
     # we copy the objects (instances) here as we also use them below from FilesUsimDfPhonebook
-    df_pb = deepcopy(df_pb_files)
+    df_pb = [f.clone() for f in df_pb_files]
     files += df_pb
 
     files += [
@@ -629,7 +717,7 @@ class FilesUsimOptionalV3(ProfileTemplate):
     oid = OID.ADF_USIMopt_not_by_default_v3
     base_path = Path('ADF.USIM')
     extends = FilesUsimMandatoryV2
-    files = FilesUsimOptionalV2.files + [
+    files = list(FilesUsimOptionalV2.files) + [
         FileTemplate(0x6f01, 'EF.eAKA', 'TR', None, 1, 3, None, None, True, ['size'], ass_serv=[134]),
     ]
 
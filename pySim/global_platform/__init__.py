@@ -18,7 +18,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import io
+import struct
 from copy import deepcopy
+from functools import lru_cache
 from typing import Optional, List, Dict, Tuple
 from construct import Optional as COptional
 from construct import Struct, GreedyRange, FlagsEnum, Int16ub, Int24ub, Padding, Bit, Const
@@ -451,15 +453,34 @@ class DataCollection(TLV_IE_Collection, nested=[IssuerIdentificationNumber,
                                                 SecurityDomainManagerURL]):
     pass
 
-def decode_select_response(resp_hex: str) -> object:
+@lru_cache(maxsize=1)
+def _data_collection_index(_num_nested: int) -> Dict[str, type]:
+    return {camel_to_snake(x.__name__): x for x in DataCollection.possible_nested}
+
+def _data_collection_by_name() -> Dict[str, type]:
+    """Return the data objects of the DataCollection by their snake_case name, as used by the 'get_data'
+    shell command.  Other modules (like pySim.euicc) append to DataCollection.possible_nested after we
+    are imported, so the index is rebuilt whenever the number of nested classes changes."""
+    return _data_collection_index(len(DataCollection.possible_nested))
+
+@lru_cache(maxsize=64)
+def _decode_fci_template(resp_hex: str) -> dict:
     t = FciTemplate()
     t.from_tlv(h2b(resp_hex))
     d = t.to_dict()
     return flatten_dict_lists(d['fci_template'])
 
+def decode_select_response(resp_hex: str) -> object:
+    # a given security domain (or ARA-M) returns the same FCI on each SELECT, so we decode each distinct
+    # response only once; the caller gets its own copy, as the result is a mutable dict
+    return deepcopy(_decode_fci_template(resp_hex))
+
 # 11.4.2.1
 StatusSubset = Enum(Byte, isd=0x80, applications=0x40, files=0x20, files_and_modules=0x10)
 
+# tag list requested by GET STATUS: AID, life cycle state, privileges, associated security domain AID
+_GET_STATUS_TAG_LIST = bytes.fromhex('5c054f9f70c5cc')
+
 
 # Section 11.4.3.1 Table 11-36
 class LifeCycleState(BER_TLV_IE, tag=0x9f70):
@@ -512,6 +533,29 @@ class GpRegistryRelatedData(BER_TLV_IE, tag=0xe3, nested=[ApplicationAID, LifeCy
                                                           ExecutableModuleAID, AssociatedSecurityDomainAID]):
     pass
 
+# CLA INS P1 P2 Lc of a (non-secure-messaging) GlobalPlatform command APDU
+_CMD_HDR = struct.Struct('BBBBB')
+
+def _gen_cmd_apdu(ins: int, p1: int, p2: int, data: bytes) -> bytes:
+    """Build a case 4 GlobalPlatform command APDU (CLA 0x80, Le 0x00) for the given command data."""
+    return _CMD_HDR.pack(0x80, ins, p1, p2, len(data)) + data + b'\x00'
+
+def _gen_establish_scp_parser() -> argparse.ArgumentParser:
+    """Generate the argument parser shared by the establish_scp02 and establish_scp03 commands."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--key-ver', type=auto_uint8, default=0, help='Key Version Number (KVN)')
+    parser.add_argument('--host-challenge', type=is_hexstr,
+                        help='Hard-code the host challenge; default: random')
+    parser.add_argument('--security-level', type=auto_uint8, default=0x01,
+                        help='Security Level. Default: 0x01 (C-MAC only)')
+    p_k = parser.add_argument_group('Manual key specification')
+    p_k.add_argument('--key-enc', type=is_hexstr, help='Secure Channel Encryption Key')
+    p_k.add_argument('--key-mac', type=is_hexstr, help='Secure Channel MAC Key')
+    p_k.add_argument('--key-dek', type=is_hexstr, help='Data Encryption Key')
+    p_csv = parser.add_argument_group('Obtain keys from CardKeyProvider (e.g. CSV')
+    p_csv.add_argument('--key-provider-suffix', help='Suffix for key names in CardKeyProvider')
+    return parser
+
 # Application Dedicated File of a Security Domain
 class ADF_SD(CardADF):
     StoreData = BitStruct('last_block'/Flag,
@@ -524,6 +568,15 @@ class ADF_SD(CardADF):
         super().__init__(aid=aid, fid=None, sfid=None, name=name, desc=desc)
         self.shell_commands += [self.AddlShellCommands()]
 
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _store_data_p1(last_block: bool, encryption: str, structure: str, response_permitted: bool) -> int:
+        """Return the P1 byte of a STORE DATA command.  There are only a few combinations of parameters,
+        so we build each of them only once instead of once for every block sent to the card."""
+        return build_construct(ADF_SD.StoreData,
+                               {'last_block': last_block, 'encryption': encryption,
+                                'structure': structure, 'response': response_permitted})[0]
+
     def decode_select_response(self, data_hex: str) -> object:
         return decode_select_response(data_hex)
 
@@ -537,12 +590,11 @@ class ADF_SD(CardADF):
         def do_get_data(self, opts):
             """Perform the GlobalPlatform GET DATA command in order to obtain some card-specific data."""
             tlv_cls_name = opts.data_object_name
-            try:
-                tlv_cls = DataCollection().members_by_name[tlv_cls_name]
-            except KeyError:
-                do_names = [camel_to_snake(str(x.__name__)) for x in DataCollection.possible_nested]
+            data_collection_by_name = _data_collection_by_name()
+            tlv_cls = data_collection_by_name.get(tlv_cls_name, None)
+            if tlv_cls is None:
                 self._cmd.poutput('Unknown data object "%s", available options: %s' % (tlv_cls_name,
-                                                                                       do_names))
+                                                                                       list(data_collection_by_name)))
                 return
             (data, _sw) = self._cmd.lchan.scc.get_data(cla=0x80, tag=tlv_cls.tag)
             ie = tlv_cls()
@@ -550,8 +602,7 @@ class ADF_SD(CardADF):
             self._cmd.poutput_json(ie.to_dict())
 
         def complete_get_data(self, text, line, begidx, endidx) -> List[str]:
-            data_dict = {camel_to_snake(str(x.__name__)): x for x in DataCollection.possible_nested}
-            index_dict = {1: data_dict}
+            index_dict = {1: _data_collection_by_name()}
             return self._cmd.index_based_complete(text, line, begidx, endidx, index_dict=index_dict)
 
         store_data_parser = argparse.ArgumentParser()
@@ -567,25 +618,23 @@ class ADF_SD(CardADF):
             response_permitted = opts.response == 'may_be_returned'
             self.store_data(h2b(opts.DATA), opts.data_structure, opts.encryption, response_permitted)
 
-        def store_data(self, data: bytes, structure:str = 'none', encryption:str = 'none', response_permitted: bool = False) -> bytes:
+        def store_data(self, data: bytes, structure:str = 'none', encryption:str = 'none', response_permitted: bool = False) -> Hexstr:
             """Perform the GlobalPlatform GET DATA command in order to store some card-specific data.
             See GlobalPlatform CardSpecification v2.3Section 11.11 for details."""
             max_cmd_len = self._cmd.lchan.scc.max_cmd_len
             # Table 11-89 of GP Card Specification v2.3
             remainder = data
             block_nr = 0
-            response = ''
+            response = []
             while len(remainder):
                 chunk = remainder[:max_cmd_len]
                 remainder = remainder[max_cmd_len:]
-                p1b = build_construct(ADF_SD.StoreData,
-                                      {'last_block': len(remainder) == 0, 'encryption': encryption,
-                                       'structure': structure, 'response': response_permitted})
-                hdr = "80E2%02x%02x%02x" % (p1b[0], block_nr, len(chunk))
-                data, _sw = self._cmd.lchan.scc.send_apdu_checksw(hdr + b2h(chunk) + "00")
+                p1 = ADF_SD._store_data_p1(len(remainder) == 0, encryption, structure, response_permitted)
+                apdu = _gen_cmd_apdu(0xe2, p1, block_nr, chunk)
+                data, _sw = self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
                 block_nr += 1
-                response += data
-            return data
+                response.append(data)
+            return ''.join(response)
 
         put_key_parser = argparse.ArgumentParser()
         put_key_parser.add_argument('--old-key-version-nr', type=auto_uint8, default=0, help='Old Key Version Number')
@@ -647,8 +696,8 @@ class ADF_SD(CardADF):
             """Perform the GlobalPlatform PUT KEY command in order to store a new key on the card.
             See GlobalPlatform CardSpecification v2.3 Section 11.8 for details."""
             key_data = kvn.to_bytes(1, 'big') + build_construct(ADF_SD.AddlShellCommands.KeyDataBasic, key_dict)
-            hdr = "80D8%02x%02x%02x" % (old_kvn, kid, len(key_data))
-            data, _sw = self._cmd.lchan.scc.send_apdu_checksw(hdr + b2h(key_data) + "00")
+            apdu = _gen_cmd_apdu(0xd8, old_kvn, kid, key_data)
+            data, _sw = self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
             return data
 
         get_status_parser = argparse.ArgumentParser()
@@ -666,14 +715,14 @@ class ADF_SD(CardADF):
                 self._cmd.poutput_json(grd.to_dict())
 
         def get_status(self, subset:str, aid_search_qualifier:Hexstr = '') -> List[GpRegistryRelatedData]:
-            subset_hex = b2h(build_construct(StatusSubset, subset))
+            p1 = build_construct(StatusSubset, subset)[0]
             aid = ApplicationAID(decoded=aid_search_qualifier)
-            cmd_data = aid.to_tlv() + h2b('5c054f9f70c5cc')
+            cmd_data = aid.to_tlv() + _GET_STATUS_TAG_LIST
             p2 = 0x02 # TLV format according to Table 11-36
             grd_list = []
             while True:
-                hdr = "80F2%s%02x%02x" % (subset_hex, p2, len(cmd_data))
-                data, sw = self._cmd.lchan.scc.send_apdu(hdr + b2h(cmd_data) + "00")
+                apdu = _gen_cmd_apdu(0xf2, p1, p2, cmd_data)
+                data, sw = self._cmd.lchan.scc.send_apdu(b2h(apdu))
                 remainder = h2b(data)
                 while len(remainder):
                     # tlv sequence, each element is one GpRegistryRelatedData()
@@ -701,11 +750,13 @@ class ADF_SD(CardADF):
             prior authentication with a Secure Channel Protocol."""
             self.set_status(opts.scope, opts.status, opts.aid)
 
+        # Section 11.10: SET STATUS command
+        SetStatus = Struct(Const(0x80, Byte), Const(0xF0, Byte),
+                           'scope'/SetStatusScope, 'status'/CLifeCycleState,
+                           'aid'/HexAdapter(Prefixed(Int8ub, COptional(GreedyBytes))))
+
         def set_status(self, scope:str, status:str, aid:Hexstr = ''):
-            SetStatus = Struct(Const(0x80, Byte), Const(0xF0, Byte),
-                               'scope'/SetStatusScope, 'status'/CLifeCycleState,
-                               'aid'/HexAdapter(Prefixed(Int8ub, COptional(GreedyBytes))))
-            apdu = build_construct(SetStatus, {'scope':scope, 'status':status, 'aid':aid})
+            apdu = build_construct(ADF_SD.AddlShellCommands.SetStatus, {'scope':scope, 'status':status, 'aid':aid})
             _data, _sw = self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
 
         inst_perso_parser = argparse.ArgumentParser()
@@ -716,7 +767,8 @@ class ADF_SD(CardADF):
             """Perform GlobalPlatform INSTALL [for personalization] command in order to inform a Security
             Domain that the following STORE DATA commands are meant for a specific AID (specified here)."""
             # Section 11.5.2.3.6 / Table 11-47
-            self.install(0x20, 0x00, "0000%02x%s000000" % (len(opts.application_aid)//2, opts.application_aid))
+            aid = h2b(opts.application_aid)
+            self.install(0x20, 0x00, b'\x00\x00' + bytes([len(aid)]) + aid + b'\x00\x00\x00')
 
         inst_inst_parser = argparse.ArgumentParser()
         inst_inst_parser.add_argument('--load-file-aid', type=is_hexstr, default='',
@@ -735,23 +787,25 @@ class ADF_SD(CardADF):
         inst_inst_parser.add_argument('--make-selectable', action='store_true',
                                       help='Install and make selectable')
 
+        # Section 11.5.2.3.2: Data Field for INSTALL [for install]
+        InstallForInstallCD = Struct('load_file_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                     'module_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                     'application_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                     'privileges'/Prefixed(Int8ub, Privileges._construct),
+                                     'install_parameters'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                     'install_token'/HexAdapter(Prefixed(Int8ub, GreedyBytes)))
+
         @cmd2.with_argparser(inst_inst_parser)
         def do_install_for_install(self, opts):
             """Perform GlobalPlatform INSTALL [for install] command in order to install an application."""
-            InstallForInstallCD = Struct('load_file_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                         'module_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                         'application_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                         'privileges'/Prefixed(Int8ub, Privileges._construct),
-                                         'install_parameters'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                         'install_token'/HexAdapter(Prefixed(Int8ub, GreedyBytes)))
             p1 = 0x04
             if opts.make_selectable:
                 p1 |= 0x08
             decoded = vars(opts)
             # convert from list to "true-dict" as required by construct.FlagsEnum
             decoded['privileges'] = {x: True for x in decoded['privileges']}
-            ifi_bytes = build_construct(InstallForInstallCD, decoded)
-            self.install(p1, 0x00, b2h(ifi_bytes))
+            ifi_bytes = build_construct(ADF_SD.AddlShellCommands.InstallForInstallCD, decoded)
+            self.install(p1, 0x00, ifi_bytes)
 
         inst_load_parser = argparse.ArgumentParser()
         inst_load_parser.add_argument('--load-file-aid', type=is_hexstr, required=True,
@@ -765,22 +819,24 @@ class ADF_SD(CardADF):
         inst_load_parser.add_argument('--load-token', type=is_hexstr, default='',
                                       help='Load Token (GPC_SPE_034, section C.4.1)')
 
+        # Section 11.5.2.3.1: Data Field for INSTALL [for load]
+        InstallForLoadCD = Struct('load_file_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                  'security_domain_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                  'load_file_hash'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                  'load_parameters'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
+                                  'load_token'/HexAdapter(Prefixed(Int8ub, GreedyBytes)))
+
         @cmd2.with_argparser(inst_load_parser)
         def do_install_for_load(self, opts):
             """Perform GlobalPlatform INSTALL [for load] command in order to prepare to load an application."""
             if opts.load_token != '' and opts.load_file_hash == '':
                 raise ValueError('Load File Data Block Hash is mandatory if a Load Token is present')
-            InstallForLoadCD = Struct('load_file_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                      'security_domain_aid'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                      'load_file_hash'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                      'load_parameters'/HexAdapter(Prefixed(Int8ub, GreedyBytes)),
-                                      'load_token'/HexAdapter(Prefixed(Int8ub, GreedyBytes)))
-            ifl_bytes = build_construct(InstallForLoadCD, vars(opts))
-            self.install(0x02, 0x00, b2h(ifl_bytes))
-
-        def install(self, p1:int, p2:int, data:Hexstr) -> ResTuple:
-            cmd_hex = "80E6%02x%02x%02x%s00" % (p1, p2, len(data)//2, data)
-            return self._cmd.lchan.scc.send_apdu_checksw(cmd_hex)
+            ifl_bytes = build_construct(ADF_SD.AddlShellCommands.InstallForLoadCD, vars(opts))
+            self.install(0x02, 0x00, ifl_bytes)
+
+        def install(self, p1:int, p2:int, data:bytes) -> ResTuple:
+            apdu = _gen_cmd_apdu(0xe6, p1, p2, data)
+            return self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
 
         del_cc_parser = argparse.ArgumentParser()
         del_cc_parser.add_argument('aid', type=is_hexstr,
@@ -794,7 +850,7 @@ class ADF_SD(CardADF):
             File, an Application or an Executable Load File and its related Applications."""
             p2 = 0x80 if opts.delete_related_objects else 0x00
             aid = ApplicationAID(decoded=opts.aid)
-            self.delete(0x00, p2, b2h(aid.to_tlv()))
+            self.delete(0x00, p2, aid.to_tlv())
 
         del_key_parser = argparse.ArgumentParser()
         del_key_parser.add_argument('--key-id', type=auto_uint7, help='Key Identifier (KID)')
@@ -810,16 +866,16 @@ class ADF_SD(CardADF):
             if opts.key_id is None and opts.key_ver is None:
                 raise ValueError('At least one of KID or KVN must be specified')
             p2 = 0x80 if opts.delete_related_objects else 0x00
-            cmd = ""
+            cmd = b''
             if opts.key_id is not None:
-                cmd += "d001%02x" % opts.key_id
+                cmd += bytes((0xd0, 0x01, opts.key_id))
             if opts.key_ver is not None:
-                cmd += "d201%02x" % opts.key_ver
+                cmd += bytes((0xd2, 0x01, opts.key_ver))
             self.delete(0x00, p2, cmd)
 
-        def delete(self, p1:int, p2:int, data:Hexstr) -> ResTuple:
-            cmd_hex = "80E4%02x%02x%02x%s00" % (p1, p2, len(data)//2, data)
-            return self._cmd.lchan.scc.send_apdu_checksw(cmd_hex)
+        def delete(self, p1:int, p2:int, data:bytes) -> ResTuple:
+            apdu = _gen_cmd_apdu(0xe4, p1, p2, data)
+            return self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
 
         load_parser = argparse.ArgumentParser()
         load_parser_from_grp = load_parser.add_mutually_exclusive_group(required=True)
@@ -855,8 +911,8 @@ class ADF_SD(CardADF):
                 p1 = 0x00 if len(remainder) else 0x80
                 p2 = block_nr % 256
                 block_nr += 1
-                cmd_hex = "80E8%02x%02x%02x%s00" % (p1, p2, len(block), b2h(block))
-                _rsp_hex, _sw = self._cmd.lchan.scc.send_apdu_checksw(cmd_hex)
+                apdu = _gen_cmd_apdu(0xe8, p1, p2, block)
+                _rsp_hex, _sw = self._cmd.lchan.scc.send_apdu_checksw(b2h(apdu))
             self._cmd.poutput("Loaded a total of %u bytes in %u blocks. Don't forget install_for_install (and make selectable) now!" % (total_size, block_nr))
 
         install_cap_parser = argparse.ArgumentParser()
@@ -911,18 +967,7 @@ class ADF_SD(CardADF):
                                         (load_file_aid, module_aid, application_aid, install_parameters))
             self._cmd.poutput("done.")
 
-        est_scp02_parser = argparse.ArgumentParser()
-        est_scp02_parser.add_argument('--key-ver', type=auto_uint8, default=0, help='Key Version Number (KVN)')
-        est_scp02_parser.add_argument('--host-challenge', type=is_hexstr,
-                                      help='Hard-code the host challenge; default: random')
-        est_scp02_parser.add_argument('--security-level', type=auto_uint8, default=0x01,
-                                      help='Security Level. Default: 0x01 (C-MAC only)')
-        est_scp02_p_k = est_scp02_parser.add_argument_group('Manual key specification')
-        est_scp02_p_k.add_argument('--key-enc', type=is_hexstr, help='Secure Channel Encryption Key')
-        est_scp02_p_k.add_argument('--key-mac', type=is_hexstr, help='Secure Channel MAC Key')
-        est_scp02_p_k.add_argument('--key-dek', type=is_hexstr, help='Data Encryption Key')
-        est_scp02_p_csv = est_scp02_parser.add_argument_group('Obtain keys from CardKeyProvider (e.g. CSV')
-        est_scp02_p_csv.add_argument('--key-provider-suffix', help='Suffix for key names in CardKeyProvider')
+        est_scp02_parser = _gen_establish_scp_parser()
 
         @cmd2.with_argparser(est_scp02_parser)
         def do_establish_scp02(self, opts):
@@ -947,8 +992,7 @@ class ADF_SD(CardADF):
             scp02 = SCP02(card_keys=kset)
             self._establish_scp(scp02, host_challenge, opts.security_level)
 
-        est_scp03_parser = deepcopy(est_scp02_parser)
-        est_scp03_parser.description = None
+        est_scp03_parser = _gen_establish_scp_parser()
         est_scp03_parser.add_argument('--s16-mode', action='store_true', help='S16 mode (S8 is default)')
 
         @cmd2.with_argparser(est_scp03_parser)
@@ -1016,6 +1060,8 @@ class CardApplicationISD(CardApplicationSD):
 
 class GpCardKeyset:
     """A single set of GlobalPlatform card keys and the associated KVN."""
+    __slots__ = ('kvn', 'enc', 'mac', 'dek')
+
     def __init__(self, kvn: int, enc: bytes, mac: bytes, dek: bytes):
         # The Key Version Number is an 8 bit integer number, where 0 refers to the first available key,
         # see also: GPC_SPE_034, section E.5.1.3
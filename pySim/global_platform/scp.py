@@ -65,8 +65,8 @@ class Scp02SessionKeys:
 
     def calc_mac_1des(self, data: bytes, reset_icv: bool = False) -> bytes:
         """Pad and calculate MAC according to B.1.2.2 - Single DES plus final 3DES"""
-        e = DES.new(self.c_mac[:8], DES.MODE_ECB)
-        d = DES.new(self.c_mac[8:], DES.MODE_ECB)
+        e = self._c_mac_e
+        d = self._c_mac_d
         padded_data = pad80(data, 8)
         q = len(padded_data) // 8
         icv = b'\x00' * 8 if reset_icv else self.icv
@@ -83,7 +83,7 @@ class Scp02SessionKeys:
         return h
 
     def calc_mac_3des(self, data: bytes) -> bytes:
-        e = DES3.new(self.enc, DES.MODE_ECB)
+        e = self._enc_e
         padded_data = pad80(data, 8)
         q = len(padded_data) // 8
         h = b'\x00' * 8
@@ -100,7 +100,12 @@ class Scp02SessionKeys:
         self.r_mac = scp02_key_derivation(self.DERIV_CONST_RMAC, self.counter, card_keys.mac)
         self.enc = scp02_key_derivation(self.DERIV_CONST_ENC, self.counter, card_keys.enc)
         self.data_enc = scp02_key_derivation(self.DERIV_CONST_DENC, self.counter, card_keys.dek)
-        self.des_icv_enc = DES.new(self.c_mac[:8], DES.MODE_ECB) if icv_encrypt else None
+        # the session keys don't change during the session, so we set up the (stateless) ECB ciphers for
+        # the C-MAC computation of each command APDU only once
+        self._c_mac_e = DES.new(self.c_mac[:8], DES.MODE_ECB)
+        self._c_mac_d = DES.new(self.c_mac[8:], DES.MODE_ECB)
+        self._enc_e = DES3.new(self.enc, DES.MODE_ECB)
+        self.des_icv_enc = self._c_mac_e if icv_encrypt else None
 
     def __str__(self) -> str:
         return "%s(CTR=%u, ICV=%s, ENC=%s, D-ENC=%s, MAC-C=%s, MAC-R=%s)" % (
@@ -38,6 +38,12 @@ class PcscSimLink(LinkBaseTpdu):
     """ pySim: PCSC reader transport link."""
     name = 'PC/SC'
 
+    # --pcsc-protocol values which force a specific protocol: (pyscard protocol, TPDU format)
+    _FORCED_PROTOCOLS = {
+        't0': (CardConnection.T0_protocol, 0),
+        't1': (CardConnection.T1_protocol, 1),
+    }
+
     def __init__(self, opts: argparse.Namespace = argparse.Namespace(pcsc_dev=0), **kwargs):
         super().__init__(**kwargs)
         self._reader = None
@@ -61,6 +67,7 @@ class PcscSimLink(LinkBaseTpdu):
         self._con = self._reader.createConnection()
         if not getattr(opts, "pcsc_shared", False):
             self._con = ExclusiveConnectCardConnection(self._con)
+        self._protocol = getattr(opts, "pcsc_protocol", None) or 'auto'
 
     def __del__(self):
         try:
@@ -84,19 +91,32 @@ class PcscSimLink(LinkBaseTpdu):
             # is disconnected
             self.disconnect()
 
-            # Make card connection and select a suitable communication protocol
+            # The user may force a specific protocol.  With T=1, the response of a case 4 command is
+            # returned in the same exchange, without any GET RESPONSE.
+            if self._protocol in self._FORCED_PROTOCOLS:
+                protocol, tpdu_format = self._FORCED_PROTOCOLS[self._protocol]
+                try:
+                    self._con.connect(protocol)
+                except CardConnectionException as exc:
+                    raise ReaderError('Card does not support protocol %s' % self._protocol.upper()) from exc
+                self.set_tpdu_format(tpdu_format)
+                return
+
+            # Make card connection and let the reader negotiate a suitable communication protocol.  We
+            # normally keep this connection; only if no single protocol was negotiated (pyscard then reports
+            # T=0|T=1), we have to connect (and hence power up the card) once more with T=0.
             self._con.connect()
-            supported_protocols = self._con.getProtocol();
-            self.disconnect()
-            if (supported_protocols & CardConnection.T0_protocol):
-                protocol =  CardConnection.T0_protocol
-                self.set_tpdu_format(0)
-            elif (supported_protocols & CardConnection.T1_protocol):
-                protocol = CardConnection.T1_protocol
+            active_protocol = self._con.getProtocol()
+            if active_protocol == CardConnection.T1_protocol:
                 self.set_tpdu_format(1)
+            elif active_protocol & CardConnection.T0_protocol:
+                self.set_tpdu_format(0)
+                if active_protocol != CardConnection.T0_protocol:
+                    self.disconnect()
+                    self._con.connect(CardConnection.T0_protocol)
             else:
+                self.disconnect()
                 raise ReaderError('Unsupported card protocol')
-            self._con.connect(protocol)
         except CardConnectionException as exc:
             raise ProtocolError() from exc
         except NoCardException as exc:
@@ -133,6 +153,8 @@ interface, if not even a generic USB CCID driver is used.  You can use a tool li
 to obtain a list of readers available on your system. """)
         pcsc_group.add_argument('--pcsc-shared', action='store_true',
                                 help='Open PC/SC reaer in SHARED access (default: EXCLUSIVE)')
+        pcsc_group.add_argument('--pcsc-protocol', choices=['auto', 't0', 't1'], default='auto',
+                                help='Transmission protocol to use with the card (default: auto, i.e. use the protocol negotiated by the reader)')
         dev_group = pcsc_group.add_mutually_exclusive_group()
         dev_group.add_argument('-p', '--pcsc-device', type=int, dest='pcsc_dev', metavar='PCSC', default=None,
                                help='Number of PC/SC reader to use for SIM access')
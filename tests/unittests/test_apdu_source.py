@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import socket
+import threading
+import unittest
+
+from osmocom.gsmtap import gsmtap_hdr_construct, GsmtapMessage
+
+from pySim.apdu import CardReset
+from pySim.apdu_source import ApduSource, ReadAheadApduSource
+from pySim.apdu_source.gsmtap import GsmtapApduSource
+
+class FakeApduSource(ApduSource):
+    """ApduSource returning the given packets, followed by StopIteration (or the given exception)."""
+    def __init__(self, packets, final_exc: Exception = StopIteration()):
+        super().__init__()
+        self.packets = list(packets)
+        self.final_exc = final_exc
+
+    def read_packet(self):
+        if not self.packets:
+            raise self.final_exc
+        return self.packets.pop(0)
+
+class BlockingApduSource(ApduSource):
+    """ApduSource returning an endless stream of packets; records how many were read."""
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def read_packet(self):
+        self.count += 1
+        return CardReset(self.count.to_bytes(4, 'big'))
+
+def resets(n: int):
+    return [CardReset(i.to_bytes(2, 'big')) for i in range(n)]
+
+class ReadAheadApduSource_Test(unittest.TestCase):
+    def test_order_and_eof(self):
+        packets = resets(100)
+        s = ReadAheadApduSource(FakeApduSource(packets), depth=8)
+        for p in packets:
+            self.assertIs(s.read(), p)
+        self.assertRaises(StopIteration, s.read)
+        # end of stream is sticky
+        self.assertRaises(StopIteration, s.read)
+        self.assertRaises(StopIteration, s.read_batch)
+
+    def test_exception(self):
+        packets = resets(3)
+        s = ReadAheadApduSource(FakeApduSource(packets, ValueError('broken')))
+        self.assertEqual(s.read_batch(10), packets)
+        self.assertRaises(ValueError, s.read)
+        self.assertRaises(ValueError, s.read)
+
+    def test_read_batch(self):
+        packets = resets(50)
+        s = ReadAheadApduSource(FakeApduSource(packets))
+        s.thread.join()
+        result = []
+        while True:
+            try:
+                batch = s.read_batch(7)
+            except StopIteration:
+                break
+            self.assertTrue(1 <= len(batch) <= 7)
+            result += batch
+        self.assertEqual(result, packets)
+
+    def test_close(self):
+        source = BlockingApduSource()
+        s = ReadAheadApduSource(source, depth=4)
+        self.assertEqual(s.read().atr, b'\x00\x00\x00\x01')
+        s.close()
+        self.assertFalse(s.thread.is_alive())
+        count = source.count
+        # the source is no longer read from
+        threading.Event().wait(0.2)
+        self.assertEqual(source.count, count)
+
+class ApduSourceReadBatch_Test(unittest.TestCase):
+    def test_default(self):
+        packets = resets(3)
+        s = FakeApduSource(packets)
+        # the default implementation returns exactly one APDU per batch
+        self.assertEqual(s.read_batch(10), packets[0:1])
+        self.assertEqual(s.read_batch(10), packets[1:2])
+        self.assertEqual(s.read_batch(10), packets[2:3])
+        self.assertRaises(StopIteration, s.read_batch)
+
+def gsmtap_sim(sub_type: str, body: bytes) -> bytes:
+    """Encode a GSMTAP-SIM message, as generated e.g. by simtrace2-sniff."""
+    return gsmtap_hdr_construct.build({'version': 2, 'hdr_len': 4, 'type': 'sim', 'timeslot': 0,
+                                       'arfcn': {'pcs': False, 'uplink': False, 'arfcn': 0},
+                                       'signal_dbm': 0, 'snr_db': 0, 'frame_nr': 0, 'sub_type': sub_type,
+                                       'antenna_nr': 0, 'sub_slot': 0, 'res': 0, 'body': body})
+
+class GsmtapApduSourceBase_Test(unittest.TestCase):
+    def setUp(self):
+        # use one end of a datagram socketpair instead of the UDP socket of a GsmtapReceiver
+        self.tx, rx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.source = GsmtapApduSource.__new__(GsmtapApduSource)
+        ApduSource.__init__(self.source)
+        self.source.gsmtap = type('FakeGsmtapReceiver', (), {'sock': rx})()
+
+    def tearDown(self):
+        self.tx.close()
+        self.source.gsmtap.sock.close()
+
+    def send(self, sub_type: str, body: bytes):
+        self.tx.send(gsmtap_sim(sub_type, body))
+
+class GsmtapReadBatch_Test(GsmtapApduSourceBase_Test):
+    def test_several(self):
+        for i in range(5):
+            self.send('atr', bytes([0x3b, i]))
+        batch = self.source.read_batch(10)
+        self.assertEqual([r.atr for r in batch], [bytes([0x3b, i]) for i in range(5)])
+
+    def test_empty_drain(self):
+        self.send('atr', b'\x3b\x00')
+        # nothing more queued: the drain must not block
+        self.assertEqual(len(self.source.read_batch(10)), 1)
+
+    def test_skipped_packets(self):
+        self.send('atr', b'\x3b\x00')
+        self.send('pps_req', b'\xff\x10\x94\x7b')
+        self.send('atr', b'\x3b\x01')
+        batch = self.source.read_batch(10)
+        self.assertEqual([r.atr for r in batch], [b'\x3b\x00', b'\x3b\x01'])
+
+    def test_max_n(self):
+        for i in range(10):
+            self.send('atr', bytes([0x3b, i]))
+        self.assertEqual(len(self.source.read_batch(4)), 4)
+        self.assertEqual(len(self.source.read_batch(4)), 4)
+        self.assertEqual(len(self.source.read_batch(4)), 2)
+
+    def test_error_after_first(self):
+        self.send('atr', b'\x3b\x00')
+        self.send('atr', b'\x3b\x01')
+        msg = bytearray(gsmtap_sim('atr', b'\x3b\x02'))
+        msg[0] = 0x03 # GSMTAP version
+        self.tx.send(msg)
+        self.send('atr', b'\x3b\x03')
+        # the APDUs received before the malformed datagram are not lost
+        self.assertEqual([r.atr for r in self.source.read_batch(10)], [b'\x3b\x00', b'\x3b\x01'])
+        # the error is raised on the next read, after which reading continues normally
+        self.assertRaises(ValueError, self.source.read)
+        self.assertEqual(self.source.read().atr, b'\x3b\x03')
+
+class GsmtapReadPacket_Test(GsmtapApduSourceBase_Test):
+    def test_atr(self):
+        atr = bytes.fromhex('3b9f96801fc78031a073be21136743200718000001a5')
+        self.send('atr', atr)
+        r = self.source.read_packet()
+        self.assertIsInstance(r, CardReset)
+        self.assertEqual(r.atr, atr)
+
+    def test_apdu(self):
+        # SELECT MF with status word
+        body = bytes.fromhex('00a40004023f00' + '9000')
+        msg = gsmtap_sim('apdu', body)
+        # our struct-based header parsing must find the same body as the full construct decoder
+        self.assertEqual(GsmtapMessage(msg).decode()['body'], body)
+        self.tx.send(msg)
+        r = self.source.read_packet()
+        self.assertEqual(type(r).__name__, 'UiccSelect')
+        self.assertEqual(r.cmd, bytes.fromhex('00a40004023f00'))
+        self.assertEqual(r.sw, b'\x90\x00')
+
+    def test_pps_ignored(self):
+        self.send('pps_rsp', b'\xff\x10\x94\x7b')
+        self.assertIsNone(self.source.read_packet())
+
+    def test_unsupported(self):
+        msg = bytearray(gsmtap_sim('atr', b'\x3b'))
+        msg[2] = 0x01 # GSMTAP type gsm_um
+        self.tx.send(msg)
+        self.assertRaises(ValueError, self.source.read_packet)
+        msg = bytearray(gsmtap_sim('atr', b'\x3b'))
+        msg[0] = 0x03 # GSMTAP version
+        self.tx.send(msg)
+        self.assertRaises(ValueError, self.source.read_packet)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from osmocom.utils import h2b
+
+from pySim.ara_m import ApduArDO
+
+def apdu_ar_do(hexstr: str) -> ApduArDO:
+    do = ApduArDO()
+    do.from_bytes(h2b(hexstr))
+    return do
+
+class ApduArDOMatch_Test(unittest.TestCase):
+    def test_generic(self):
+        self.assertTrue(apdu_ar_do('01').match(0x00a40004))
+        self.assertFalse(apdu_ar_do('00').match(0x00a40004))
+
+    def test_exact(self):
+        do = apdu_ar_do('80ca9f7f' 'ffffffff')
+        self.assertTrue(do.match(0x80ca9f7f))
+        self.assertFalse(do.match(0x80ca9f7e))
+        self.assertFalse(do.match(0x00ca9f7f))
+
+    def test_masked(self):
+        # any P1/P2 for two different CLA/INS
+        do = apdu_ar_do('a0a40000' 'ffff0000' '80ca0000' 'ffff0000')
+        self.assertTrue(do.match(0xa0a40004))
+        self.assertTrue(do.match(0x80ca9f7f))
+        self.assertFalse(do.match(0x80cb0000))
+        # bits of the header outside of the mask are irrelevant
+        do = apdu_ar_do('80caffff' 'ffff0000')
+        self.assertTrue(do.match(0x80ca0000))
+
+    def test_cache_invalidation(self):
+        do = apdu_ar_do('80ca0000' 'ffff0000')
+        self.assertTrue(do.match(0x80ca0000))
+        # re-decode with a different filter: the cached masks must not be used anymore
+        do.from_bytes(h2b('80e20000' 'ffff0000'))
+        self.assertFalse(do.match(0x80ca0000))
+        self.assertTrue(do.match(0x80e20000))
+        # switching to a generic rule, too
+        do.from_bytes(h2b('00'))
+        self.assertFalse(do.match(0x80e20000))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -17,8 +17,10 @@
 
 import unittest
 import logging
+from types import SimpleNamespace
 from osmocom.utils import b2h, h2b
 
+import pySim.global_platform
 from pySim.global_platform import *
 from pySim.global_platform.scp import *
 from pySim.global_platform.install_param import gen_install_parameters
@@ -298,5 +300,45 @@ class Install_param_Test(unittest.TestCase):
         load_parameters = gen_install_parameters(None, None, '')
         self.assertEqual(load_parameters, 'c900')
 
+class FakeScc:
+    """Minimal SimCardCommands replacement recording all command APDUs sent."""
+    def __init__(self, max_cmd_len: int):
+        self.max_cmd_len = max_cmd_len
+        self.apdus = []
+
+    def send_apdu_checksw(self, apdu: Hexstr):
+        self.apdus.append(apdu)
+        return '%02x' % len(self.apdus), '9000'
+
+class StoreData_Test(unittest.TestCase):
+    def setUp(self):
+        self.scc = FakeScc(max_cmd_len=4)
+        self.cmds = ADF_SD.AddlShellCommands()
+        self.cmds._cmd = SimpleNamespace(lchan=SimpleNamespace(scc=self.scc))
+
+    def test_single_block(self):
+        res = self.cmds.store_data(h2b('0102'), 'dgi', response_permitted=True)
+        self.assertEqual(self.scc.apdus, ['80e28900' '02' '0102' '00'])
+        self.assertEqual(res, '01')
+
+    def test_multiple_blocks(self):
+        res = self.cmds.store_data(h2b('00010203040506070809'), 'dgi', response_permitted=True)
+        # three blocks, only the last one has the 'last block' bit set in P1
+        self.assertEqual(self.scc.apdus, ['80e20900' '04' '00010203' '00',
+                                          '80e20901' '04' '04050607' '00',
+                                          '80e28902' '02' '0809' '00'])
+        # the responses of all blocks are concatenated
+        self.assertEqual(res, '010203')
+
+class DataCollectionByName_Test(unittest.TestCase):
+    def test_known(self):
+        self.assertIs(pySim.global_platform._data_collection_by_name()['card_data'], CardData)
+
+    def test_extended_after_import(self):
+        # populate the index before pySim.euicc (possibly) extends the DataCollection
+        pySim.global_platform._data_collection_by_name()
+        from pySim.euicc import Sgp02Eid
+        self.assertIs(pySim.global_platform._data_collection_by_name()['sgp02_eid'], Sgp02Eid)
+
 if __name__ == "__main__":
 	unittest.main()
@@ -32,6 +32,7 @@ import pySim.gsm_r
 import pySim.cdma_ruim
 import pySim.global_platform
 import pySim.global_platform.http
+import pySim.ara_m
 
 if 'unittest.util' in __import__('sys').modules:
     # Show full diff in self.assertEqual.
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import unittest
+from unittest import mock
+
+from smartcard.CardConnection import CardConnection
+from smartcard.Exceptions import CardConnectionException
+
+from pySim.exceptions import ReaderError
+from pySim.transport.pcsc import PcscSimLink
+
+T0 = CardConnection.T0_protocol
+T1 = CardConnection.T1_protocol
+
+class FakeCardConnection:
+    """Mimics a pyscard CardConnection: a plain connect() lets the reader negotiate a protocol,
+    connect(protocol) fails if the card doesn't support that protocol.  getProtocol() returns
+    the one active protocol."""
+    def __init__(self, supported: int, negotiated: int):
+        self.supported = supported
+        self.negotiated = negotiated
+        self.active = None
+        self.connects = []
+
+    def connect(self, protocol=None):
+        self.connects.append(protocol)
+        if protocol is None:
+            self.active = self.negotiated
+        elif protocol & self.supported:
+            self.active = protocol
+        else:
+            raise CardConnectionException('protocol not supported')
+
+    def getProtocol(self):
+        return self.active
+
+    def disconnect(self):
+        self.active = None
+
+class FakeReader:
+    def __init__(self, con: FakeCardConnection):
+        self.name = 'Fake Reader 00 00'
+        self.con = con
+
+    def createConnection(self):
+        return self.con
+
+class PcscProtocolSelection_Test(unittest.TestCase):
+    def _link(self, protocol: str, supported: int, negotiated: int) -> PcscSimLink:
+        con = FakeCardConnection(supported, negotiated)
+        opts = argparse.Namespace(pcsc_dev=0, pcsc_regex=None, pcsc_shared=True, pcsc_protocol=protocol)
+        with mock.patch('pySim.transport.pcsc.readers', return_value=[FakeReader(con)]):
+            return PcscSimLink(opts)
+
+    def test_auto(self):
+        for negotiated in [T0, T1]:
+            with self.subTest(negotiated=negotiated):
+                link = self._link('auto', T0 | T1, negotiated)
+                link.connect()
+                self.assertEqual(link._con.getProtocol(), negotiated)
+                self.assertEqual(link.protocol, 0 if negotiated == T0 else 1)
+                # the connection established by the negotiation is kept
+                self.assertEqual(link._con.connects, [None])
+
+    def test_auto_no_single_protocol(self):
+        link = self._link('auto', T0 | T1, T0 | T1)
+        link.connect()
+        self.assertEqual(link._con.getProtocol(), T0)
+        self.assertEqual(link.protocol, 0)
+        self.assertEqual(link._con.connects, [None, T0])
+
+    def test_forced(self):
+        for protocol, expected, tpdu_format in [('t0', T0, 0), ('t1', T1, 1)]:
+            for negotiated in [T0, T1]:
+                with self.subTest(protocol=protocol, negotiated=negotiated):
+                    link = self._link(protocol, T0 | T1, negotiated)
+                    link.connect()
+                    self.assertEqual(link._con.getProtocol(), expected)
+                    self.assertEqual(link.protocol, tpdu_format)
+                    self.assertEqual(link._con.connects, [expected])
+
+    def test_forced_unsupported(self):
+        for protocol, supported in [('t0', T1), ('t1', T0)]:
+            with self.subTest(protocol=protocol):
+                link = self._link(protocol, supported, supported)
+                with self.assertRaises(ReaderError):
+                    link.connect()
+
+if __name__ == "__main__":
+	unittest.main()